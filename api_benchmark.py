@@ -0,0 +1,126 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from api_server import PlannerAPI, create_server
+from database import StudyPlannerDB
+from load_test import percentile
+from openrouter_stub import OpenRouterStub
+from planner_agent import AIStudyPlannerAgent
+
+
+def seed_plans(base_url, count, rng):
+    """Create plans through the API and return their ids"""
+    plan_ids = []
+    for _ in range(count):
+        exam_date = (datetime.now().date() + timedelta(days=rng.randint(14, 60))).strftime("%Y-%m-%d")
+        response = requests.post(f"{base_url}/plans", json={
+            "subjects": ["Math", "Physics"],
+            "exam_date": exam_date,
+            "daily_hours": rng.randint(2, 6),
+        })
+        response.raise_for_status()
+        plan_ids.extend(response.json()["plan_ids"])
+    return plan_ids
+
+
+def run_client(base_url, plan_ids, args, deadline, latencies, statuses, lock, seed):
+    """Send a weighted mix of reads and writes until the deadline"""
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.time() < deadline:
+        plan_id = rng.choice(plan_ids)
+        roll = rng.random()
+        start = time.perf_counter()
+        try:
+            if roll < args.write_ratio:
+                page = session.get(f"{base_url}/plans/{plan_id}/schedule", params={"page_size": 5})
+                open_items = [item for item in page.json().get("items", []) if not item["completed"]]
+                if open_items:
+                    operation = "complete"
+                    item = open_items[0]
+                    response = session.post(f"{base_url}/schedule/{item['id']}/complete",
+                                            json={"actual_hours": item["planned_hours"], "version": item["version"]})
+                else:
+                    # Nothing left to complete; only the read happened
+                    operation = "schedule"
+                    response = page
+            elif roll < args.write_ratio + args.llm_ratio:
+                operation = "tip"
+                response = session.get(f"{base_url}/plans/{plan_id}/tip")
+            elif roll < 0.5 + args.write_ratio / 2:
+                operation = "schedule"
+                response = session.get(f"{base_url}/plans/{plan_id}/schedule",
+                                       params={"page": rng.randint(1, 3), "page_size": 20})
+            else:
+                operation = "progress"
+                response = session.get(f"{base_url}/plans/{plan_id}/progress")
+            status = response.status_code
+        except requests.RequestException:
+            operation, status = "error", "connection"
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with lock:
+            latencies.setdefault(operation, []).append(elapsed_ms)
+            statuses[status] = statuses.get(status, 0) + 1
+
+
+def run_benchmark(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="study_planner_api_"), "api_benchmark.db")
+    with OpenRouterStub(latency=args.llm_latency) as stub:
+        db = StudyPlannerDB(db_path, pooled=True)
+        agent = AIStudyPlannerAgent(db=db, api_url=stub.url, request_timeout=args.timeout)
+        api = PlannerAPI(agent, workers=args.workers, request_timeout=args.timeout)
+        server = create_server(api, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        try:
+            plan_ids = seed_plans(base_url, args.plans, random.Random(args.seed))
+            latencies, statuses, lock = {}, {}, threading.Lock()
+            deadline = time.time() + args.duration
+            clients = [
+                threading.Thread(target=run_client,
+                                 args=(base_url, plan_ids, args, deadline, latencies, statuses, lock, args.seed + i))
+                for i in range(args.clients)
+            ]
+            start = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            api.shutdown()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"Clients: {args.clients}  Workers: {args.workers}  Duration: {elapsed:.1f}s")
+    print(f"Requests: {total}  Throughput: {total / elapsed:.1f} req/s")
+    print(f"Status codes: {dict(sorted(statuses.items(), key=str))}")
+    print()
+    print(f"{'operation':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, values in sorted(latencies.items()):
+        print(f"{operation:<12}{len(values):>8}{percentile(values, 50):>10.2f}"
+              f"{percentile(values, 95):>10.2f}{percentile(values, 99):>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the study planner HTTP API against a stubbed LLM")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, default=8, help="API worker threads")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run")
+    parser.add_argument("--plans", type=int, default=20, help="Plans created before the run")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Share of requests that complete a session")
+    parser.add_argument("--llm-ratio", type=float, default=0.05, help="Share of requests that fetch an AI tip")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub LLM latency in seconds")
+    parser.add_argument("--timeout", type=float, default=10.0, help="API request timeout in seconds")
+    parser.add_argument("--db", default=None, help="Database file (defaults to a fresh temporary file)")
+    parser.add_argument("--seed", type=int, default=0)
+    run_benchmark(parser.parse_args())
@@ -0,0 +1,363 @@
+import argparse
+import json
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from database import StudyPlannerDB, ConcurrentUpdateError
+from planner_agent import AIStudyPlannerAgent, DIFFICULTY_MULTIPLIER
+from openrouter_stub import OpenRouterStub
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_PAGE = 10000  # Keeps the OFFSET well inside SQLite's integer range
+
+# Plan generation does work per day until the exam, so bound both factors
+MAX_DAILY_HOURS = 24
+MAX_PLAN_DAYS = 730
+
+
+class APIError(Exception):
+    """An error that maps directly to an HTTP status code"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _plan_to_dict(row):
+    plan_id, user_id, subject, exam_date, daily_hours, difficulty, total_hours, completed_hours, status, created_at = row
+    return {
+        "id": plan_id,
+        "user_id": user_id,
+        "subject": subject,
+        "exam_date": exam_date,
+        "daily_hours": daily_hours,
+        "difficulty": difficulty,
+        "total_hours": total_hours,
+        "completed_hours": completed_hours,
+        "status": status,
+        "created_at": created_at,
+    }
+
+
+def _schedule_to_dict(row):
+    schedule_id, plan_id, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at, version = row
+    return {
+        "id": schedule_id,
+        "plan_id": plan_id,
+        "date": study_date,
+        "subject": subject,
+        "planned_hours": planned_hours,
+        "actual_hours": actual_hours,
+        "completed": bool(completed),
+        "missed": bool(missed),
+        "notes": notes,
+        "version": version,
+    }
+
+
+def _progress_to_dict(row):
+    progress_id, plan_id, date, subject, hours_completed, notes, created_at = row
+    return {
+        "id": progress_id,
+        "plan_id": plan_id,
+        "date": date,
+        "subject": subject,
+        "hours_completed": hours_completed,
+        "notes": notes,
+    }
+
+
+def _require(body, field):
+    if field not in body:
+        raise APIError(400, f"Missing field '{field}'")
+    return body[field]
+
+
+def _date_field(body, field):
+    value = _require(body, field)
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise APIError(400, f"'{field}' must be a date string in YYYY-MM-DD format")
+    return value
+
+
+def _number_field(value, field):
+    # json.loads accepts NaN and Infinity, which SQLite and JSON responses cannot hold
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise APIError(400, f"'{field}' must be a number")
+    if not math.isfinite(value):
+        raise APIError(400, f"'{field}' must be a finite number")
+    return value
+
+
+def _id_field(body, field):
+    value = body.get(field)
+    # bool is a subclass of int but never a valid id
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+        raise APIError(400, f"'{field}' must be a positive integer")
+    return value
+
+
+def _int_param(query, name, default, minimum=1, maximum=None):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise APIError(400, f"Query parameter '{name}' must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise APIError(400, f"Query parameter '{name}' is out of range")
+    return value
+
+
+class PlannerAPI:
+    """JSON endpoints on top of AIStudyPlannerAgent and StudyPlannerDB"""
+
+    def __init__(self, agent, workers=8, request_timeout=10.0):
+        self.agent = agent
+        self.db = agent.db
+        self.request_timeout = request_timeout
+        # Bounds how many requests touch the database or the LLM at once
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="planner-api")
+        self.routes = [
+            ("GET", re.compile(r"^/health$"), self.health),
+            ("POST", re.compile(r"^/users$"), self.create_user),
+            ("GET", re.compile(r"^/users/(\d+)/plans$"), self.list_plans),
+            ("POST", re.compile(r"^/plans$"), self.create_plan),
+            ("GET", re.compile(r"^/plans/(\d+)$"), self.get_plan),
+            ("GET", re.compile(r"^/plans/(\d+)/schedule$"), self.get_schedule),
+            ("POST", re.compile(r"^/plans/(\d+)/missed$"), self.mark_missed),
+            ("POST", re.compile(r"^/schedule/(\d+)/complete$"), self.mark_completed),
+            ("GET", re.compile(r"^/plans/(\d+)/progress$"), self.get_progress),
+            ("GET", re.compile(r"^/plans/(\d+)/tip$"), self.get_tip),
+        ]
+
+    def handle(self, method, path, query, body):
+        """Route a request and run it on the worker pool. Returns (status, payload)."""
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                future = self.executor.submit(handler, query, body, *[int(g) for g in match.groups()])
+                try:
+                    return future.result(timeout=self.request_timeout)
+                except FutureTimeoutError:
+                    # The worker keeps running; the client just stops waiting
+                    return 504, {"error": f"Request timed out after {self.request_timeout}s"}
+                except APIError as e:
+                    return e.status, {"error": e.message}
+                except ConcurrentUpdateError as e:
+                    return 409, {"error": str(e)}
+                except Exception as e:
+                    print(f"Error handling {method} {path}: {e}")
+                    return 500, {"error": "Internal server error"}
+        return 404, {"error": "Not found"}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def _get_plan_or_404(self, plan_id):
+        plan = self.db.get_study_plan(plan_id)
+        if not plan:
+            raise APIError(404, f"Study plan {plan_id} not found")
+        return plan
+
+    def health(self, query, body):
+        return 200, {"status": "ok"}
+
+    def create_user(self, query, body):
+        return 201, {"user_id": self.db.create_user()}
+
+    def list_plans(self, query, body, user_id):
+        return 200, {"plans": [_plan_to_dict(plan) for plan in self.db.get_all_study_plans(user_id)]}
+
+    def create_plan(self, query, body):
+        subjects = _require(body, "subjects")
+        if (not isinstance(subjects, list) or not subjects
+                or not all(isinstance(subject, str) and subject.strip() for subject in subjects)):
+            raise APIError(400, "'subjects' must be a non-empty list of subject names")
+        exam_date = _date_field(body, "exam_date")
+        if datetime.strptime(exam_date, "%Y-%m-%d") > datetime.now() + timedelta(days=MAX_PLAN_DAYS):
+            raise APIError(400, f"'exam_date' must be within {MAX_PLAN_DAYS} days from today")
+        daily_hours = _number_field(_require(body, "daily_hours"), "daily_hours")
+        if not 0 < daily_hours <= MAX_DAILY_HOURS:
+            raise APIError(400, f"'daily_hours' must be greater than 0 and at most {MAX_DAILY_HOURS}")
+        difficulties = body.get("difficulties") or {}
+        if not isinstance(difficulties, dict):
+            raise APIError(400, "'difficulties' must be an object mapping subjects to a difficulty")
+        subject_difficulties = {subject: difficulties.get(subject, "medium") for subject in subjects}
+        if any(not isinstance(level, str) or level not in DIFFICULTY_MULTIPLIER
+               for level in subject_difficulties.values()):
+            raise APIError(400, f"Difficulties must be one of: {', '.join(DIFFICULTY_MULTIPLIER)}")
+
+        user_id = _id_field(body, "user_id")
+        if user_id is None:
+            user_id = self.db.create_user()
+        elif not self.db.get_user(user_id):
+            raise APIError(404, f"User {user_id} not found")
+        plan_ids = self.agent.create_study_plan(user_id, subjects, exam_date, daily_hours, subject_difficulties)
+        return 201, {"user_id": user_id, "plan_ids": plan_ids}
+
+    def get_plan(self, query, body, plan_id):
+        return 200, _plan_to_dict(self._get_plan_or_404(plan_id))
+
+    def get_schedule(self, query, body, plan_id):
+        self._get_plan_or_404(plan_id)
+        page = _int_param(query, "page", 1, maximum=MAX_PAGE)
+        page_size = _int_param(query, "page_size", DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE)
+        rows, total = self.db.get_daily_schedule_page(plan_id, page_size, (page - 1) * page_size)
+        return 200, {
+            "plan_id": plan_id,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "items": [_schedule_to_dict(row) for row in rows],
+        }
+
+    def mark_missed(self, query, body, plan_id):
+        self._get_plan_or_404(plan_id)
+        missed_date = _date_field(body, "date")
+        entries = self.db.get_daily_schedule_range(plan_id, missed_date, missed_date)
+        if not entries:
+            raise APIError(404, f"No schedule entry for plan {plan_id} on {missed_date}")
+        if any(entry[6] for entry in entries):
+            raise APIError(409, f"{missed_date} is already completed")
+        adjusted = self.agent.adjust_schedule_after_missed_day(plan_id, missed_date)
+        return 200, {"plan_id": plan_id, "date": missed_date, "adjusted": adjusted or []}
+
+    def mark_completed(self, query, body, schedule_id):
+        entry = self.db.get_schedule_entry(schedule_id)
+        if not entry:
+            raise APIError(404, f"Schedule entry {schedule_id} not found")
+        _, plan_id, study_date, subject, planned_hours, _, completed, missed, _, _, version = entry
+        if completed:
+            raise APIError(409, f"Schedule entry {schedule_id} is already completed")
+        if missed:
+            raise APIError(409, f"Schedule entry {schedule_id} was marked as missed")
+        # Same limits as the Streamlit page's input
+        actual_hours = _number_field(body.get("actual_hours", planned_hours), "actual_hours")
+        if not 0 <= actual_hours <= planned_hours * 2:
+            raise APIError(400, f"'actual_hours' must be between 0 and {planned_hours * 2}")
+
+        # Clients may pass the version they displayed to detect edits made since
+        expected_version = body.get("version", version)
+        if not isinstance(expected_version, int) or isinstance(expected_version, bool):
+            raise APIError(400, "'version' must be an integer")
+        if not self.db.mark_day_completed(schedule_id, actual_hours, expected_version=expected_version):
+            raise ConcurrentUpdateError(f"Schedule entry {schedule_id} was modified by another session")
+        self.db.update_progress(plan_id, study_date, subject, actual_hours)
+        return 200, {"id": schedule_id, "plan_id": plan_id, "actual_hours": actual_hours}
+
+    def get_progress(self, query, body, plan_id):
+        self._get_plan_or_404(plan_id)
+        return 200, {
+            "plan_id": plan_id,
+            "completed_hours": self.db.get_completed_hours(plan_id),
+            "entries": [_progress_to_dict(row) for row in self.db.get_progress(plan_id)],
+        }
+
+    def get_tip(self, query, body, plan_id):
+        plan_id, user_id, subject, exam_date, daily_hours, difficulty, total_hours, completed_hours, status, created_at = \
+            self._get_plan_or_404(plan_id)
+        progress = (completed_hours / total_hours * 100) if total_hours and total_hours > 0 else 0
+        return 200, {"plan_id": plan_id, "tip": self.agent.generate_motivational_tip(subject, round(progress, 1))}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse connections
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait on delayed ACKs
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        body = {}
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Reading a negative length would block until the client disconnects
+            self.close_connection = True
+            self._send(400, {"error": "Invalid Content-Length header"})
+            return
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._send(400, {"error": "Request body must be JSON"})
+                return
+            if not isinstance(body, dict):
+                self._send(400, {"error": "Request body must be a JSON object"})
+                return
+        status, payload = self.server.api.handle(method, url.path, parse_qs(url.query), body)
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(api, host="127.0.0.1", port=8000, verbose=False):
+    """Build an HTTP server for a PlannerAPI; call serve_forever() to run it"""
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.api = api
+    server.verbose = verbose
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the study planner as a JSON HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default="study_planner.db", help="Database file")
+    parser.add_argument("--shards", type=int, default=None, help="Shard count (defaults to STUDY_PLANNER_SHARDS)")
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads handling requests")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument("--llm-url", default="https://openrouter.ai/api/v1/chat/completions",
+                        help="Chat completions endpoint")
+    parser.add_argument("--llm-timeout", type=float, default=30, help="LLM request timeout in seconds")
+    parser.add_argument("--stub-llm", type=float, default=None, metavar="LATENCY",
+                        help="Answer LLM calls from a local stub with this latency in seconds")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    stub = None
+    llm_url = args.llm_url
+    if args.stub_llm is not None:
+        stub = OpenRouterStub(latency=args.stub_llm).start()
+        llm_url = stub.url
+
+    db = StudyPlannerDB(args.db, shard_count=args.shards, pooled=True)
+    agent = AIStudyPlannerAgent(db=db, api_url=llm_url, request_timeout=args.llm_timeout)
+    api = PlannerAPI(agent, workers=args.workers, request_timeout=args.timeout)
+    server = create_server(api, args.host, args.port, args.verbose)
+    print(f"Study planner API listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        api.shutdown()
+        if stub:
+            stub.stop()
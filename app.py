@@ -1,7 +1,9 @@
+import time
 import streamlit as st
 from datetime import datetime, timedelta
-from database import StudyPlannerDB
+from database import StudyPlannerDB, ConcurrentUpdateError
 from planner_agent import AIStudyPlannerAgent
+import instrumentation
 
 # Initialize session state
 if 'user_id' not in st.session_state:
@@ -28,6 +30,9 @@ agent = AIStudyPlannerAgent()
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Go to", ["Home", "Create Plan", "View Schedule", "Daily Plan", "Progress Tracking"])
 
+# Time the page branch below; recorded at the end of the script
+page_render_start = time.perf_counter()
+
 if page == "Home":
     st.header("Welcome to AI Study Planner Agent!")
     st.write("""
@@ -61,15 +66,51 @@ if page == "Home":
 elif page == "Create Plan":
     st.header("Create Your Study Plan")
     
+    # Subjects and difficulties sit outside the form so the What-if Explorer
+    # below follows edits to them without submitting (and saving) a plan
+    subjects_input = st.text_input("Subjects (comma separated)", "Math, Physics, Chemistry")
+    difficulty_input = st.text_input("Subject Difficulties (comma separated, options: easy, medium, hard)", "medium, medium, medium")
+    
     # Input form
     with st.form("study_plan_form"):
-        subjects_input = st.text_input("Subjects (comma separated)", "Math, Physics, Chemistry")
         exam_date = st.date_input("Exam Date", value=datetime.today() + timedelta(days=30))
         daily_hours = st.slider("Daily Study Hours", min_value=1, max_value=12, value=4)
-        difficulty_input = st.text_input("Subject Difficulties (comma separated, options: easy, medium, hard)", "medium, medium, medium")
         
         submitted = st.form_submit_button("Generate Study Plan")
     
+    # What-if explorer: try combinations of hours and exam dates without saving a plan
+    with st.expander("🔮 What-if Explorer"):
+        whatif_subjects = [s.strip() for s in subjects_input.split(',') if s.strip()]
+        whatif_levels = [d.strip() for d in difficulty_input.split(',')]
+        form_difficulties = {
+            subject: whatif_levels[i] if i < len(whatif_levels) else "medium"
+            for i, subject in enumerate(whatif_subjects)
+        }
+        
+        hours_range = st.slider("Daily hours to compare", min_value=1, max_value=12, value=(2, 8))
+        max_days = st.slider("Exam dates up to (days from today)", min_value=7, max_value=120, value=60)
+        difficulty_choice = st.selectbox("Difficulty", ["As entered above", "easy", "medium", "hard"])
+        
+        if whatif_subjects:
+            scenarios = agent.simulate_scenarios(
+                subjects=whatif_subjects,
+                daily_hours_options=range(hours_range[0], hours_range[1] + 1),
+                exam_dates=[datetime.today().date() + timedelta(days=d) for d in range(1, max_days + 1)],
+                difficulties=[form_difficulties if difficulty_choice == "As entered above" else difficulty_choice]
+            )
+            scenarios["Coverage %"] = scenarios["scaling_factor"] * 100
+            chart = scenarios.pivot(index="exam_date", columns="daily_hours", values="Coverage %")
+            chart.columns = [f"{int(h)}h/day" for h in chart.columns]
+            st.write("Share of the recommended study hours that fits before each exam date:")
+            st.line_chart(chart)
+            
+            feasible = scenarios[scenarios["feasible"]]
+            if not feasible.empty:
+                earliest = feasible.sort_values(["exam_date", "daily_hours"]).iloc[0]
+                st.info(f"Earliest fully covered exam date: {earliest['exam_date']} at {int(earliest['daily_hours'])}h/day")
+            else:
+                st.warning("No combination in this range covers all recommended study hours.")
+    
     if submitted:
         subjects = [s.strip() for s in subjects_input.split(',')]
         difficulties = [d.strip() for d in difficulty_input.split(',')]
@@ -82,37 +123,17 @@ elif page == "Create Plan":
             else:
                 subject_difficulties[subject] = "medium"  # default
         
-        # Generate the study plan
-        plan_data = agent.calculate_study_schedule(
+        # Generate the study plan and save it to the database
+        plan_ids = agent.create_study_plan(
+            user_id=st.session_state.user_id,
             subjects=subjects,
             exam_date_str=exam_date.strftime("%Y-%m-%d"),
             daily_hours=daily_hours,
             subject_difficulties=subject_difficulties
         )
         
-        # Save the plan to database
-        for subject in subjects:
-            plan_id = db.create_study_plan(
-                user_id=st.session_state.user_id,
-                subject=subject,
-                exam_date=exam_date.strftime("%Y-%m-%d"),
-                daily_hours=daily_hours,
-                difficulty=subject_difficulties[subject],
-                total_hours=plan_data['subject_hours'][subject]
-            )
-            
-            # Create daily schedule entries
-            for sched_item in plan_data['schedule']:
-                if sched_item['subject'] == subject:
-                    db.create_daily_schedule(
-                        plan_id=plan_id,
-                        study_date=sched_item['date'],
-                        subject=sched_item['subject'],
-                        planned_hours=sched_item['hours']
-                    )
-        
         st.success("Study plan created successfully!")
-        st.session_state.current_plan_id = plan_id  # Just set to last created plan ID
+        st.session_state.current_plan_id = plan_ids[-1]  # Just set to last created plan ID
         st.rerun()
 
 elif page == "View Schedule":
@@ -165,11 +186,13 @@ elif page == "View Schedule":
                         for item in schedule:
                             id, plan_id, study_date, subj, planned_hours, actual_hours, completed, missed, notes, created_at = item
                             if str(study_date) == str(selected_date) and not completed and not missed:
-                                # Mark as missed
-                                db.mark_day_missed(id)
-                                
-                                # Adjust the schedule
-                                adjusted_schedule = agent.adjust_schedule_after_missed_day(st.session_state.current_plan_id, selected_date)
+                                # Mark as missed and adjust the schedule; the agent does both
+                                # with version checks so concurrent edits are not lost
+                                try:
+                                    adjusted_schedule = agent.adjust_schedule_after_missed_day(st.session_state.current_plan_id, selected_date)
+                                except ConcurrentUpdateError:
+                                    st.warning("This plan was changed in another session. Please try again.")
+                                    break
                                 
                                 st.success(f"Day {selected_date} marked as missed. Schedule has been adjusted.")
                                 if adjusted_schedule:
@@ -194,13 +217,14 @@ elif page == "Daily Plan":
             
             # Get today's schedule
             today = datetime.now().date()
-            schedule = db.get_daily_schedule(st.session_state.current_plan_id, str(today))
+            # Rows carry their version so completing one can detect edits from another session
+            schedule = db.get_daily_schedule_range(st.session_state.current_plan_id, today, today, with_version=True)
             
             if schedule:
                 st.subheader(f"Today's Plan ({today}) - {subject}")
                 
                 for item in schedule:
-                    id, plan_id, study_date, subj, planned_hours, actual_hours, completed, missed, notes, created_at = item
+                    id, plan_id, study_date, subj, planned_hours, actual_hours, completed, missed, notes, created_at, version = item
                     
                     if str(study_date) == str(today):
                         if missed:
@@ -221,10 +245,13 @@ elif page == "Daily Plan":
                             )
                             
                             if st.button(f"Mark as Completed", key=f"complete_{id}"):
-                                db.mark_day_completed(id, actual_hours_input)
-                                db.update_progress(plan_id, str(today), subj, actual_hours_input)
-                                st.success("Day marked as completed!")
-                                st.rerun()
+                                # Only log progress if this session's update applied, so hours are not double-counted
+                                if db.mark_day_completed(id, actual_hours_input, expected_version=version):
+                                    db.update_progress(plan_id, str(today), subj, actual_hours_input)
+                                    st.success("Day marked as completed!")
+                                    st.rerun()
+                                else:
+                                    st.warning("This day was changed in another session. Please refresh and try again.")
                 
                 # Show motivational tip
                 progress = (completed_hours / total_hours * 100) if total_hours and total_hours > 0 else 0
@@ -297,4 +324,20 @@ elif page == "Progress Tracking":
         else:
             st.error("Plan not found.")
     else:
-        st.info("Select a plan from the home page or create a new one.")
\ No newline at end of file
+        st.info("Select a plan from the home page or create a new one.")
+
+# Record the page render time and show the optional debug panel
+if instrumentation.is_enabled():
+    instrumentation.record(f"page.{page}", (time.perf_counter() - page_render_start) * 1000.0)
+    instrumentation.export()
+    
+    with st.sidebar.expander("⏱️ Performance"):
+        metrics = instrumentation.snapshot()
+        if metrics:
+            import pandas as pd
+            metrics_df = pd.DataFrame(metrics)
+            st.dataframe(metrics_df[['operation', 'count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']])
+        else:
+            st.write("No operations recorded yet.")
+        if st.button("Reset metrics"):
+            instrumentation.reset()
@@ -1,17 +1,201 @@
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import glob
 import os
+import random
+import re
+import threading
+from urllib.parse import quote
+
+from instrumentation import timed
+
+# Version 1: dates are stored as integer day ordinals (date.toordinal()) so
+# range predicates compare integers on an index instead of parsing strings.
+# Version 2: archive tables for finished plans.
+# Version 3: row versions on study_plans and daily_schedule for optimistic concurrency.
+SCHEMA_VERSION = 3
+
+# julianday(d) - JULIAN_DAY_ORDINAL_OFFSET == d.toordinal()
+JULIAN_DAY_ORDINAL_OFFSET = 1721424.5
+
+# Columns returned for each row, in the order callers unpack them
+PLAN_COLUMNS = "id, user_id, subject, exam_date, daily_hours, difficulty, total_hours, completed_hours, status, created_at"
+SCHEDULE_COLUMNS = "id, plan_id, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at"
+PROGRESS_COLUMNS = "id, plan_id, date, subject, hours_completed, notes, created_at"
+
+# Columns copied from each hot table into its archive table
+ARCHIVED_COLUMNS = {
+    "study_plans": PLAN_COLUMNS,
+    "daily_schedule": SCHEDULE_COLUMNS,
+    "progress_tracking": PROGRESS_COLUMNS,
+}
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a compare-and-swap update finds rows changed by another session"""
+
+
+class ShardConfigurationError(Exception):
+    """Raised when the configured shard count does not match the database files on disk"""
+
+
+def to_day_ordinal(value):
+    """Convert a date, datetime, 'YYYY-MM-DD' string or ordinal to an integer day ordinal"""
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date().toordinal()
+
+
+def from_day_ordinal(value):
+    """Convert a stored day ordinal back to a 'YYYY-MM-DD' string"""
+    if isinstance(value, int):
+        return date.fromordinal(value).isoformat()
+    return value
+
+
+def _read_only_uri(path):
+    """SQLite URI that opens an existing database file read-only"""
+    return f"file:{quote(path)}?mode=ro"
+
+
+def _with_iso_date(row, index):
+    """Return a row with the day ordinal at index converted to a date string"""
+    if row is None:
+        return None
+    return row[:index] + (from_day_ordinal(row[index]),) + row[index + 1:]
+
 
 class StudyPlannerDB:
-    def __init__(self, db_path="study_planner.db"):
+    def __init__(self, db_path="study_planner.db", shard_count=None, pooled=False):
         self.db_path = db_path
+        
+        # Pooled mode keeps one open connection per shard per thread, for
+        # long-running servers where reconnecting on every call dominates
+        self.pooled = pooled
+        self._local = threading.local()
+        
+        # Sharded mode splits users across N database files so that
+        # independent users never contend for the same SQLite write lock
+        if shard_count is None:
+            shard_count = int(os.environ.get("STUDY_PLANNER_SHARDS", "1"))
+        self.shard_count = max(1, shard_count)
+        if self.shard_count == 1:
+            self.shard_paths = [db_path]
+        else:
+            root, ext = os.path.splitext(db_path)
+            self.shard_paths = [f"{root}.shard{i}{ext}" for i in range(self.shard_count)]
+        
+        self._check_shard_layout()
         self.init_db()
     
+    def _check_shard_layout(self):
+        """
+        Refuse to start when the files on disk were written with a different
+        shard count, since ids would route to the wrong file and existing
+        users and plans would silently disappear.
+        """
+        root, ext = os.path.splitext(self.db_path)
+        pattern = re.compile(re.escape(root) + r"\.shard(\d+)" + re.escape(ext) + "$")
+        existing = sorted(
+            int(match.group(1))
+            for match in (pattern.match(path) for path in glob.glob(f"{glob.escape(root)}.shard*{ext}"))
+            if match
+        )
+        
+        if self.shard_count == 1:
+            if existing:
+                raise ShardConfigurationError(
+                    f"Found {len(existing)} shard files next to {self.db_path}; "
+                    f"set STUDY_PLANNER_SHARDS to the shard count they were created with"
+                )
+            return
+        
+        if existing and existing != list(range(self.shard_count)):
+            raise ShardConfigurationError(
+                f"Shard files for {self.db_path} do not match shard_count={self.shard_count} "
+                f"(found shards {existing}); the shard count cannot change once data exists"
+            )
+        if self._has_data(self.db_path):
+            raise ShardConfigurationError(
+                f"{self.db_path} already holds unsharded data; sharded mode would ignore it. "
+                f"Unset STUDY_PLANNER_SHARDS or start from an empty database"
+            )
+    
+    @staticmethod
+    def _has_data(path):
+        """Whether an existing database file contains any users"""
+        if not os.path.exists(path):
+            return False
+        conn = sqlite3.connect(_read_only_uri(path), uri=True)
+        try:
+            return conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False  # No users table yet
+        finally:
+            conn.close()
+    
+    def shard_for(self, row_id):
+        """
+        Return the shard index that owns a user, plan, schedule or progress id.
+        Ids are allocated so that id % shard_count is the owning shard.
+        """
+        if row_id is None:
+            return 0
+        return int(row_id) % self.shard_count
+    
+    def connect(self, row_id=None):
+        """Open (or reuse, when pooled) a connection to the shard that owns the given id"""
+        shard_path = self.shard_paths[self.shard_for(row_id)]
+        if not self.pooled:
+            return sqlite3.connect(shard_path)
+        
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(shard_path)
+        if conn is None:
+            conn = connections[shard_path] = sqlite3.connect(shard_path)
+        elif conn.in_transaction:
+            conn.rollback()  # Left open by a call that raised
+        return conn
+    
+    def release(self, conn):
+        """Give back a connection from connect(); pooled connections stay open"""
+        if not self.pooled:
+            conn.close()
+    
+    def _next_id_sql(self, table, shard):
+        """
+        SQL expression and parameters for the id of a new row in a shard.
+        Unsharded databases let AUTOINCREMENT pick the id; sharded ones step
+        by shard_count from the shard index so the id encodes its shard
+        (the first id is shard + shard_count, so 0 is never used).
+        """
+        if self.shard_count == 1:
+            return "NULL", ()
+        return (
+            "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), ?) + ?",
+            (table, shard, self.shard_count)
+        )
+    
+    @timed("db.init_db")
     def init_db(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        for shard_path in self.shard_paths:
+            self._init_shard(shard_path)
+    
+    def _init_shard(self, shard_path):
+        conn = sqlite3.connect(shard_path)
         cursor = conn.cursor()
         
+        # Let compact() return free pages to the OS without a full VACUUM.
+        # Only takes effect on a new file; compact() converts older ones.
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        
         # Create users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -68,159 +252,420 @@ class StudyPlannerDB:
             )
         ''')
         
+        self._migrate(cursor)
+        
         conn.commit()
         conn.close()
     
+    def _migrate(self, cursor):
+        """Bring an existing shard up to SCHEMA_VERSION"""
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        # Take the write lock and re-check so concurrent startups migrate only once
+        cursor.execute("BEGIN IMMEDIATE")
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            # Convert TEXT dates to integer day ordinals
+            for table, column in (("study_plans", "exam_date"),
+                                  ("daily_schedule", "study_date"),
+                                  ("progress_tracking", "date")):
+                cursor.execute(f'''
+                    UPDATE {table}
+                    SET {column} = CAST(julianday({column}) - ? AS INTEGER)
+                    WHERE typeof({column}) = 'text'
+                ''', (JULIAN_DAY_ORDINAL_OFFSET,))
+            
+            # Index the date columns for equality and range predicates
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_daily_schedule_plan_date
+                ON daily_schedule (plan_id, study_date)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_progress_tracking_plan_date
+                ON progress_tracking (plan_id, date)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_study_plans_exam_date
+                ON study_plans (exam_date)
+            ''')
+        
+        if version < 2:
+            # Archive tables keep the original ids so archived rows stay traceable
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS study_plans_archive (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    subject TEXT NOT NULL,
+                    exam_date DATE NOT NULL,
+                    daily_hours REAL NOT NULL,
+                    difficulty TEXT,
+                    total_hours REAL,
+                    completed_hours REAL,
+                    status TEXT,
+                    created_at TIMESTAMP,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_schedule_archive (
+                    id INTEGER PRIMARY KEY,
+                    plan_id INTEGER,
+                    study_date DATE NOT NULL,
+                    subject TEXT NOT NULL,
+                    planned_hours REAL NOT NULL,
+                    actual_hours REAL,
+                    completed BOOLEAN,
+                    missed BOOLEAN,
+                    notes TEXT,
+                    created_at TIMESTAMP,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS progress_tracking_archive (
+                    id INTEGER PRIMARY KEY,
+                    plan_id INTEGER,
+                    date DATE NOT NULL,
+                    subject TEXT NOT NULL,
+                    hours_completed REAL,
+                    notes TEXT,
+                    created_at TIMESTAMP,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_study_plans_archive_user
+                ON study_plans_archive (user_id)
+            ''')
+            
+            # Used by get_all_study_plans and orphaned-user pruning
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_study_plans_user
+                ON study_plans (user_id, status)
+            ''')
+        
+        if version < 3:
+            # Bumped by every update so concurrent sessions can detect lost updates
+            cursor.execute("ALTER TABLE study_plans ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("ALTER TABLE daily_schedule ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    @timed("db.create_user")
     def create_user(self):
         """Create a new user"""
-        conn = sqlite3.connect(self.db_path)
+        # New users are spread evenly over the shards
+        shard = random.randrange(self.shard_count)
+        conn = self.connect(shard)
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO users DEFAULT VALUES")
+        id_sql, id_params = self._next_id_sql("users", shard)
+        cursor.execute(f"INSERT INTO users (id) VALUES ({id_sql})", id_params)
         user_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        self.release(conn)
         return user_id
     
+    @timed("db.get_user")
+    def get_user(self, user_id):
+        """Get a user by ID, or None if it does not exist"""
+        conn = self.connect(user_id)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, created_at FROM users WHERE id = ?
+        ''', (user_id,))
+        
+        result = cursor.fetchone()
+        self.release(conn)
+        return result
+    
+    @timed("db.create_study_plan")
     def create_study_plan(self, user_id, subject, exam_date, daily_hours, difficulty='medium', total_hours=None):
         """Create a new study plan"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(user_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
+        id_sql, id_params = self._next_id_sql("study_plans", self.shard_for(user_id))
+        cursor.execute(f'''
             INSERT INTO study_plans 
-            (user_id, subject, exam_date, daily_hours, difficulty, total_hours)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, subject, exam_date, daily_hours, difficulty, total_hours))
+            (id, user_id, subject, exam_date, daily_hours, difficulty, total_hours)
+            VALUES ({id_sql}, ?, ?, ?, ?, ?, ?)
+        ''', (*id_params, user_id, subject, to_day_ordinal(exam_date), daily_hours, difficulty, total_hours))
         
         plan_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        self.release(conn)
         return plan_id
     
+    @timed("db.get_study_plan")
     def get_study_plan(self, plan_id):
         """Get a specific study plan"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT * FROM study_plans WHERE id = ?
+        cursor.execute(f'''
+            SELECT {PLAN_COLUMNS} FROM study_plans WHERE id = ?
         ''', (plan_id,))
         
         result = cursor.fetchone()
-        conn.close()
-        return result
+        self.release(conn)
+        return _with_iso_date(result, 3)
     
+    @timed("db.get_all_study_plans")
     def get_all_study_plans(self, user_id):
         """Get all study plans for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(user_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT * FROM study_plans WHERE user_id = ? AND status = 'active'
+        cursor.execute(f'''
+            SELECT {PLAN_COLUMNS} FROM study_plans WHERE user_id = ? AND status = 'active'
         ''', (user_id,))
         
         results = cursor.fetchall()
-        conn.close()
-        return results
+        self.release(conn)
+        return [_with_iso_date(row, 3) for row in results]
     
+    @timed("db.create_daily_schedule")
     def create_daily_schedule(self, plan_id, study_date, subject, planned_hours):
         """Create a daily schedule entry"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
+        id_sql, id_params = self._next_id_sql("daily_schedule", self.shard_for(plan_id))
+        cursor.execute(f'''
             INSERT INTO daily_schedule 
-            (plan_id, study_date, subject, planned_hours)
-            VALUES (?, ?, ?, ?)
-        ''', (plan_id, study_date, subject, planned_hours))
+            (id, plan_id, study_date, subject, planned_hours)
+            VALUES ({id_sql}, ?, ?, ?, ?)
+        ''', (*id_params, plan_id, to_day_ordinal(study_date), subject, planned_hours))
         
         schedule_id = cursor.lastrowid
         conn.commit()
-        conn.close()
+        self.release(conn)
         return schedule_id
     
+    @timed("db.get_daily_schedule")
     def get_daily_schedule(self, plan_id, date=None):
         """Get daily schedule for a plan, optionally filtered by date"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
-        if date:
-            cursor.execute('''
-                SELECT * FROM daily_schedule 
+        if date is not None:
+            cursor.execute(f'''
+                SELECT {SCHEDULE_COLUMNS} FROM daily_schedule 
                 WHERE plan_id = ? AND study_date = ?
                 ORDER BY study_date
-            ''', (plan_id, date))
+            ''', (plan_id, to_day_ordinal(date)))
         else:
-            cursor.execute('''
-                SELECT * FROM daily_schedule 
+            cursor.execute(f'''
+                SELECT {SCHEDULE_COLUMNS} FROM daily_schedule 
                 WHERE plan_id = ? 
                 ORDER BY study_date
             ''', (plan_id,))
         
         results = cursor.fetchall()
-        conn.close()
-        return results
+        self.release(conn)
+        return [_with_iso_date(row, 2) for row in results]
     
-    def mark_day_missed(self, schedule_id):
-        """Mark a day as missed"""
-        conn = sqlite3.connect(self.db_path)
+    @timed("db.get_daily_schedule_range")
+    def get_daily_schedule_range(self, plan_id, start_date=None, end_date=None, with_version=False):
+        """
+        Get daily schedule entries for a plan within an inclusive date window.
+        With with_version=True each row ends with its version, for use with
+        update_planned_hours and the expected_version arguments.
+        """
+        conn = self.connect(plan_id)
+        cursor = conn.cursor()
+        
+        # Open-ended windows use the smallest and largest valid ordinals
+        start = to_day_ordinal(start_date) if start_date is not None else date.min.toordinal()
+        end = to_day_ordinal(end_date) if end_date is not None else date.max.toordinal()
+        columns = f"{SCHEDULE_COLUMNS}, version" if with_version else SCHEDULE_COLUMNS
+        cursor.execute(f'''
+            SELECT {columns} FROM daily_schedule
+            WHERE plan_id = ? AND study_date BETWEEN ? AND ?
+            ORDER BY study_date
+        ''', (plan_id, start, end))
+        
+        results = cursor.fetchall()
+        self.release(conn)
+        return [_with_iso_date(row, 2) for row in results]
+    
+    @timed("db.get_daily_schedule_page")
+    def get_daily_schedule_page(self, plan_id, limit, offset=0):
+        """Get one page of a plan's daily schedule, with the total number of entries"""
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
         cursor.execute('''
-            UPDATE daily_schedule 
-            SET missed = TRUE 
-            WHERE id = ?
+            SELECT COUNT(*) FROM daily_schedule WHERE plan_id = ?
+        ''', (plan_id,))
+        total = cursor.fetchone()[0]
+        
+        cursor.execute(f'''
+            SELECT {SCHEDULE_COLUMNS}, version FROM daily_schedule
+            WHERE plan_id = ?
+            ORDER BY study_date, id
+            LIMIT ? OFFSET ?
+        ''', (plan_id, limit, offset))
+        
+        results = cursor.fetchall()
+        self.release(conn)
+        return [_with_iso_date(row, 2) for row in results], total
+    
+    @timed("db.get_schedule_entry")
+    def get_schedule_entry(self, schedule_id):
+        """Get a single daily schedule entry, ending with its version"""
+        conn = self.connect(schedule_id)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT {SCHEDULE_COLUMNS}, version FROM daily_schedule WHERE id = ?
         ''', (schedule_id,))
         
+        result = cursor.fetchone()
+        self.release(conn)
+        return _with_iso_date(result, 2)
+    
+    @timed("db.mark_day_missed")
+    def mark_day_missed(self, schedule_id, expected_version=None):
+        """
+        Mark a day as missed. If expected_version is given the update only
+        applies when the row is still at that version. Returns True if applied.
+        """
+        conn = self.connect(schedule_id)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE daily_schedule
+            SET missed = TRUE, version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
+        ''', (schedule_id, expected_version, expected_version))
+        
+        updated = cursor.rowcount == 1
         conn.commit()
-        conn.close()
+        self.release(conn)
+        return updated
     
-    def mark_day_completed(self, schedule_id, actual_hours=0):
-        """Mark a day as completed"""
-        conn = sqlite3.connect(self.db_path)
+    @timed("db.mark_day_completed")
+    def mark_day_completed(self, schedule_id, actual_hours=0, expected_version=None):
+        """
+        Mark a day as completed. If expected_version is given the update only
+        applies when the row is still at that version. Returns True if applied.
+        """
+        conn = self.connect(schedule_id)
         cursor = conn.cursor()
         
         cursor.execute('''
-            UPDATE daily_schedule 
-            SET completed = TRUE, actual_hours = ?
-            WHERE id = ?
-        ''', (actual_hours, schedule_id))
+            UPDATE daily_schedule
+            SET completed = TRUE, actual_hours = ?, version = version + 1
+            WHERE id = ? AND (? IS NULL OR version = ?)
+        ''', (actual_hours, schedule_id, expected_version, expected_version))
         
+        updated = cursor.rowcount == 1
         conn.commit()
-        conn.close()
+        self.release(conn)
+        return updated
+    
+    @timed("db.get_plan_version")
+    def get_plan_version(self, plan_id):
+        """Get the current version of a study plan, or None if it does not exist"""
+        conn = self.connect(plan_id)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT version FROM study_plans WHERE id = ?
+        ''', (plan_id,))
+        
+        result = cursor.fetchone()
+        self.release(conn)
+        return result[0] if result else None
+    
+    @timed("db.update_planned_hours")
+    def update_planned_hours(self, plan_id, plan_version, updates, missed_entry=None):
+        """
+        Apply rebalanced hours as one compare-and-swap transaction.
+        updates is a list of (schedule_id, expected_version, planned_hours);
+        missed_entry, if given, is the (schedule_id, expected_version) of the
+        day being marked missed in the same transaction.
+        Raises ConcurrentUpdateError, changing nothing, if the plan or any
+        row was modified since it was read.
+        """
+        conn = self.connect(plan_id)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                UPDATE study_plans
+                SET version = version + 1
+                WHERE id = ? AND version = ?
+            ''', (plan_id, plan_version))
+            if cursor.rowcount != 1:
+                raise ConcurrentUpdateError(f"Study plan {plan_id} was modified by another session")
+            
+            if missed_entry is not None:
+                cursor.execute('''
+                    UPDATE daily_schedule
+                    SET missed = TRUE, version = version + 1
+                    WHERE id = ? AND plan_id = ? AND version = ?
+                ''', (missed_entry[0], plan_id, missed_entry[1]))
+                if cursor.rowcount != 1:
+                    raise ConcurrentUpdateError(f"Schedule entry {missed_entry[0]} was modified by another session")
+            
+            cursor.executemany('''
+                UPDATE daily_schedule
+                SET planned_hours = ?, version = version + 1
+                WHERE id = ? AND plan_id = ? AND version = ?
+            ''', [(hours, schedule_id, plan_id, version) for schedule_id, version, hours in updates])
+            if cursor.rowcount != len(updates):
+                raise ConcurrentUpdateError(f"Schedule for plan {plan_id} was modified by another session")
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
     
+    @timed("db.update_progress")
     def update_progress(self, plan_id, date, subject, hours_completed, notes=None):
         """Update progress tracking"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
+        id_sql, id_params = self._next_id_sql("progress_tracking", self.shard_for(plan_id))
+        cursor.execute(f'''
             INSERT INTO progress_tracking 
-            (plan_id, date, subject, hours_completed, notes)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (plan_id, date, subject, hours_completed, notes))
+            (id, plan_id, date, subject, hours_completed, notes)
+            VALUES ({id_sql}, ?, ?, ?, ?, ?)
+        ''', (*id_params, plan_id, to_day_ordinal(date), subject, hours_completed, notes))
         
         conn.commit()
-        conn.close()
+        self.release(conn)
     
+    @timed("db.get_progress")
     def get_progress(self, plan_id):
         """Get progress for a study plan"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT * FROM progress_tracking 
+        cursor.execute(f'''
+            SELECT {PROGRESS_COLUMNS} FROM progress_tracking 
             WHERE plan_id = ?
             ORDER BY date
         ''', (plan_id,))
         
         results = cursor.fetchall()
-        conn.close()
-        return results
+        self.release(conn)
+        return [_with_iso_date(row, 2) for row in results]
     
+    @timed("db.get_completed_hours")
     def get_completed_hours(self, plan_id):
         """Get total completed hours for a plan"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -229,19 +674,145 @@ class StudyPlannerDB:
         ''', (plan_id,))
         
         result = cursor.fetchone()[0]
-        conn.close()
+        self.release(conn)
         return result or 0
     
+    @timed("db.update_plan_status")
     def update_plan_status(self, plan_id, status):
         """Update the status of a study plan"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect(plan_id)
         cursor = conn.cursor()
         
         cursor.execute('''
             UPDATE study_plans 
-            SET status = ? 
+            SET status = ?, version = version + 1
             WHERE id = ?
         ''', (status, plan_id))
         
         conn.commit()
-        conn.close()
\ No newline at end of file
+        self.release(conn)
+    
+    @timed("db.query_all_shards")
+    def query_all_shards(self, query, params=()):
+        """Run a read-only admin query on every shard and combine the rows"""
+        results = []
+        for shard_path in self.shard_paths:
+            # Read-only connections, so a writing statement fails instead of applying
+            conn = sqlite3.connect(_read_only_uri(shard_path), uri=True)
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            results.extend(cursor.fetchall())
+            conn.close()
+        return results
+    
+    @timed("db.archive_finished_plans")
+    def archive_finished_plans(self, before_date=None, batch_size=100):
+        """
+        Move plans whose exam date is before before_date (default: today) into
+        the archive tables together with their schedule and progress rows.
+        Each batch is its own short transaction so the app is never blocked for long.
+        """
+        cutoff = to_day_ordinal(before_date if before_date is not None else date.today())
+        archived = 0
+        
+        for shard in range(self.shard_count):
+            conn = self.connect(shard)
+            cursor = conn.cursor()
+            try:
+                while True:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute('''
+                        SELECT id FROM study_plans
+                        WHERE exam_date < ?
+                        LIMIT ?
+                    ''', (cutoff, batch_size))
+                    plan_ids = [row[0] for row in cursor.fetchall()]
+                    if not plan_ids:
+                        conn.rollback()
+                        break
+                    
+                    placeholders = ", ".join("?" * len(plan_ids))
+                    for table, key in (("daily_schedule", "plan_id"),
+                                       ("progress_tracking", "plan_id"),
+                                       ("study_plans", "id")):
+                        columns = ARCHIVED_COLUMNS[table]
+                        cursor.execute(f'''
+                            INSERT OR REPLACE INTO {table}_archive ({columns})
+                            SELECT {columns} FROM {table} WHERE {key} IN ({placeholders})
+                        ''', plan_ids)
+                        cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", plan_ids)
+                    
+                    cursor.execute(f'''
+                        UPDATE study_plans_archive
+                        SET status = 'archived'
+                        WHERE id IN ({placeholders})
+                    ''', plan_ids)
+                    conn.commit()
+                    archived += len(plan_ids)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.release(conn)
+        
+        return archived
+    
+    @timed("db.prune_orphan_users")
+    def prune_orphan_users(self, older_than_days=1, batch_size=500):
+        """
+        Delete users that never created a plan. Recent users are kept because
+        they may belong to a Streamlit session that has not created a plan yet.
+        """
+        cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+        pruned = 0
+        
+        for shard in range(self.shard_count):
+            conn = self.connect(shard)
+            cursor = conn.cursor()
+            try:
+                while True:
+                    cursor.execute('''
+                        DELETE FROM users WHERE id IN (
+                            SELECT id FROM users
+                            WHERE created_at < ?
+                            AND NOT EXISTS (SELECT 1 FROM study_plans WHERE user_id = users.id)
+                            AND NOT EXISTS (SELECT 1 FROM study_plans_archive WHERE user_id = users.id)
+                            LIMIT ?
+                        )
+                    ''', (cutoff, batch_size))
+                    deleted = cursor.rowcount
+                    conn.commit()
+                    pruned += deleted
+                    if deleted < batch_size:
+                        break
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.release(conn)
+        
+        return pruned
+    
+    @timed("db.compact")
+    def compact(self, max_pages=None):
+        """
+        Return free pages to the OS with an incremental vacuum and refresh the
+        query planner statistics. Files created before incremental auto-vacuum
+        was enabled get a one-time full VACUUM to switch them over.
+        """
+        for shard in range(self.shard_count):
+            conn = sqlite3.connect(self.shard_paths[shard])
+            conn.isolation_level = None  # VACUUM cannot run inside a transaction
+            cursor = conn.cursor()
+            
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+            elif max_pages is None:
+                cursor.execute("PRAGMA incremental_vacuum")
+            else:
+                cursor.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            cursor.fetchall()
+            
+            cursor.execute("ANALYZE")
+            conn.close()
\ No newline at end of file
@@ -0,0 +1,185 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_enabled = os.environ.get("STUDY_PLANNER_METRICS", "").lower() in ("1", "true", "yes", "on")
+_lock = threading.Lock()
+_stats = {}
+
+
+def is_enabled():
+    """Return True if timing spans are being recorded"""
+    return _enabled
+
+
+def set_enabled(enabled):
+    """Turn span recording on or off at runtime"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+class _OperationStats:
+    """Aggregated latency histogram and counters for one operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms, error):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        if error:
+            self.errors += 1
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q):
+        """Estimate a latency quantile from the histogram buckets"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            seen += self.buckets[i]
+            if seen >= target:
+                return min(float(upper), self.max_ms)
+        return self.max_ms
+
+
+def record(operation, elapsed_ms, error=False):
+    """Record a single timing observation for an operation"""
+    with _lock:
+        stats = _stats.get(operation)
+        if stats is None:
+            stats = _stats[operation] = _OperationStats()
+        stats.observe(elapsed_ms, error)
+
+
+@contextmanager
+def span(operation):
+    """Time the enclosed block and record it under the given operation name"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(operation, (time.perf_counter() - start) * 1000.0, error)
+
+
+def timed(operation):
+    """Decorator that wraps every call of a function in a timing span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                record(operation, (time.perf_counter() - start) * 1000.0, error)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Return a summary of all recorded operations, sorted by total time spent"""
+    with _lock:
+        rows = []
+        for operation, stats in _stats.items():
+            rows.append({
+                "operation": operation,
+                "count": stats.count,
+                "errors": stats.errors,
+                "total_ms": round(stats.total_ms, 3),
+                "mean_ms": round(stats.total_ms / stats.count, 3) if stats.count else 0.0,
+                "p50_ms": round(stats.quantile(0.50), 3),
+                "p95_ms": round(stats.quantile(0.95), 3),
+                "p99_ms": round(stats.quantile(0.99), 3),
+                "max_ms": round(stats.max_ms, 3),
+                "buckets": list(stats.buckets),
+            })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+
+def reset():
+    """Discard all recorded observations"""
+    with _lock:
+        _stats.clear()
+
+
+def export_jsonl(path):
+    """Write one JSON line per operation with the current aggregates"""
+    timestamp = time.time()
+
+    # The aggregates are cumulative, so each export replaces the previous one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for row in snapshot():
+            row["timestamp"] = timestamp
+            f.write(json.dumps(row) + "\n")
+    os.replace(tmp_path, path)
+
+
+def export_prometheus(path):
+    """Write the current aggregates as a Prometheus text exposition file"""
+    lines = [
+        "# HELP study_planner_operation_latency_ms Latency of instrumented operations in milliseconds",
+        "# TYPE study_planner_operation_latency_ms histogram",
+    ]
+    errors = [
+        "# HELP study_planner_operation_errors_total Instrumented operations that raised an exception",
+        "# TYPE study_planner_operation_errors_total counter",
+    ]
+    for row in snapshot():
+        label = row["operation"].replace("\\", "\\\\").replace('"', '\\"')
+        cumulative = 0
+        for upper, bucket in zip(LATENCY_BUCKETS_MS, row["buckets"]):
+            cumulative += bucket
+            lines.append(f'study_planner_operation_latency_ms_bucket{{operation="{label}",le="{upper}"}} {cumulative}')
+        lines.append(f'study_planner_operation_latency_ms_bucket{{operation="{label}",le="+Inf"}} {row["count"]}')
+        lines.append(f'study_planner_operation_latency_ms_sum{{operation="{label}"}} {row["total_ms"]}')
+        lines.append(f'study_planner_operation_latency_ms_count{{operation="{label}"}} {row["count"]}')
+        errors.append(f'study_planner_operation_errors_total{{operation="{label}"}} {row["errors"]}')
+
+    # Write to a temporary file first so scrapers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines + errors) + "\n")
+    os.replace(tmp_path, path)
+
+
+def export(path=None):
+    """Export metrics to the configured file; the format follows the file extension"""
+    path = path or os.environ.get("STUDY_PLANNER_METRICS_FILE")
+    if not path or not _enabled:
+        return
+    if path.endswith(".jsonl"):
+        export_jsonl(path)
+    else:
+        export_prometheus(path)
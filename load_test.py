@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import StudyPlannerDB
+from openrouter_stub import OpenRouterStub
+from planner_agent import AIStudyPlannerAgent
+
+SUBJECTS = ["Math", "Physics", "Chemistry", "Biology", "History"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def is_lock_error(error):
+    """True if an exception is SQLite lock contention"""
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class LoadTestResults:
+    """Thread-safe collector of per-operation latencies and errors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.lock_errors = {}
+        self.other_errors = {}
+        self.flows_completed = 0
+
+    def timed(self, operation, func, *args, **kwargs):
+        """Run func, recording its latency or the error it raised"""
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                bucket = self.lock_errors if is_lock_error(e) else self.other_errors
+                bucket[operation] = bucket.get(operation, 0) + 1
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed_ms)
+        return result
+
+    def flow_done(self):
+        with self._lock:
+            self.flows_completed += 1
+
+    def summary(self, elapsed_seconds, sessions):
+        """Build the report as a plain dict"""
+        operations = {}
+        for operation in sorted(set(self.latencies) | set(self.lock_errors) | set(self.other_errors)):
+            values = self.latencies.get(operation, [])
+            operations[operation] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "max_ms": round(max(values), 2) if values else 0.0,
+                "lock_errors": self.lock_errors.get(operation, 0),
+                "other_errors": self.other_errors.get(operation, 0),
+            }
+        total_ops = sum(len(values) for values in self.latencies.values())
+        return {
+            "sessions": sessions,
+            "elapsed_seconds": round(elapsed_seconds, 2),
+            "flows_completed": self.flows_completed,
+            "flows_per_second": round(self.flows_completed / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+            "operations_per_second": round(total_ops / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+            "lock_errors": sum(self.lock_errors.values()),
+            "other_errors": sum(self.other_errors.values()),
+            "operations": operations,
+        }
+
+
+def run_user_flow(agent, results, rng):
+    """One realistic session: create a plan, view it, miss a day, complete a day, view progress"""
+    db = agent.db
+    user_id = results.timed("create_user", db.create_user)
+
+    # Create plan
+    subjects = rng.sample(SUBJECTS, rng.randint(1, 3))
+    subject_difficulties = {subject: rng.choice(DIFFICULTIES) for subject in subjects}
+    exam_date = (datetime.now().date() + timedelta(days=rng.randint(7, 60))).strftime("%Y-%m-%d")
+    plan_ids = results.timed(
+        "create_plan", agent.create_study_plan,
+        user_id, subjects, exam_date, rng.randint(2, 8), subject_difficulties
+    )
+    plan_id = plan_ids[-1]
+
+    # View schedule
+    _, schedule = results.timed("view_schedule", lambda: (db.get_study_plan(plan_id), db.get_daily_schedule(plan_id)))
+
+    # Mark an upcoming day as missed, the way the View Schedule page does
+    open_days = [item for item in schedule if not item[6] and not item[7]]
+    if len(open_days) > 1:
+        missed = rng.choice(open_days[1:])
+        results.timed("mark_missed_and_adjust", agent.adjust_schedule_after_missed_day, plan_id, missed[2])
+
+    # Complete today's session, the way the Daily Plan page does
+    if open_days:
+        today_item = open_days[0]
+        actual_hours = round(today_item[4] * rng.uniform(0.5, 1.2), 1)
+        results.timed("complete_session", lambda: (
+            db.mark_day_completed(today_item[0], actual_hours),
+            db.update_progress(plan_id, str(today_item[2]), today_item[3], actual_hours)
+        ))
+
+    # View progress, including the AI tip shown alongside it
+    results.timed("view_progress", lambda: (db.get_study_plan(plan_id), db.get_progress(plan_id)))
+    results.timed("motivational_tip", agent.generate_motivational_tip, subjects[-1], 10)
+    results.flow_done()
+
+
+def run_session(session_index, args, api_url, results, deadline):
+    rng = random.Random(args.seed + session_index)
+    agent = AIStudyPlannerAgent(api_key="stub", db_path=args.db, api_url=api_url,
+                                request_timeout=args.llm_timeout)
+    iterations = 0
+    while (time.time() < deadline) if deadline else (iterations < args.iterations):
+        try:
+            run_user_flow(agent, results, rng)
+        except Exception:
+            pass  # Already counted by the results collector
+        iterations += 1
+        if args.think_time:
+            time.sleep(rng.uniform(0, args.think_time))
+
+
+def run_load_test(args):
+    """Start the stub, run all sessions concurrently and return the summary"""
+    StudyPlannerDB(args.db)  # Create the schema before sessions start
+    with OpenRouterStub(latency=args.llm_latency, jitter=args.llm_jitter) as stub:
+        results = LoadTestResults()
+        deadline = time.time() + args.duration if args.duration else None
+        threads = [
+            threading.Thread(target=run_session, args=(i, args, stub.url, results, deadline))
+            for i in range(args.sessions)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    return results.summary(elapsed, args.sessions)
+
+
+def print_report(summary):
+    print(f"Sessions: {summary['sessions']}  Elapsed: {summary['elapsed_seconds']}s")
+    print(f"Flows completed: {summary['flows_completed']} ({summary['flows_per_second']}/s), "
+          f"operations: {summary['operations_per_second']}/s")
+    print(f"Lock-contention errors: {summary['lock_errors']}  Other errors: {summary['other_errors']}")
+    print()
+    print(f"{'operation':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'locked':>8}{'errors':>8}")
+    for operation, stats in summary["operations"].items():
+        print(f"{operation:<20}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}{stats['lock_errors']:>8}{stats['other_errors']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent study planner sessions")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of concurrent user sessions")
+    parser.add_argument("--iterations", type=int, default=3, help="Flows per session")
+    parser.add_argument("--duration", type=float, default=0, help="Keep running flows for this many seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between flows in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub LLM latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Extra random stub LLM latency in seconds")
+    parser.add_argument("--llm-timeout", type=float, default=30, help="Agent request timeout in seconds")
+    parser.add_argument("--db", default=None, help="Database file (defaults to a fresh temporary file)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.db is None:
+        args.db = os.path.join(tempfile.mkdtemp(prefix="study_planner_load_"), "load_test.db")
+
+    summary = run_load_test(args)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
@@ -0,0 +1,43 @@
+import argparse
+import time
+from datetime import datetime
+
+from database import StudyPlannerDB
+
+
+def run_maintenance(db, batch_size=100, orphan_age_days=1, vacuum=True):
+    """Archive finished plans, prune orphaned users and compact the database"""
+    started = time.perf_counter()
+    archived = db.archive_finished_plans(batch_size=batch_size)
+    pruned = db.prune_orphan_users(older_than_days=orphan_age_days)
+    if vacuum:
+        db.compact()
+    return {
+        "archived_plans": archived,
+        "pruned_users": pruned,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Archive finished study plans and compact the database. "
+                    "Run it from cron, or pass --every to keep it running."
+    )
+    parser.add_argument("--db", default="study_planner.db", help="Database file")
+    parser.add_argument("--shards", type=int, default=None, help="Shard count (defaults to STUDY_PLANNER_SHARDS)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Plans archived per transaction")
+    parser.add_argument("--orphan-age-days", type=float, default=1,
+                        help="Only prune users without plans that are older than this")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip incremental VACUUM and ANALYZE")
+    parser.add_argument("--every", type=float, default=0, help="Repeat every this many hours")
+    args = parser.parse_args()
+
+    db = StudyPlannerDB(args.db, shard_count=args.shards)
+    while True:
+        result = run_maintenance(db, args.batch_size, args.orphan_age_days, not args.no_vacuum)
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Archived {result['archived_plans']} plans, "
+              f"pruned {result['pruned_users']} users in {result['seconds']}s")
+        if not args.every:
+            break
+        time.sleep(args.every * 3600)
@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers OpenRouter chat completion requests with a canned reply"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+
+        # Simulate model latency with optional jitter
+        stub = self.server.stub
+        delay = stub.latency + random.uniform(0, stub.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if stub.error_rate and random.random() < stub.error_rate:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = json.dumps({
+            "id": "stub-completion",
+            "model": "stub",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": stub.reply},
+                    "finish_reason": "stop"
+                }
+            ]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OpenRouterStub:
+    """Local stand-in for the OpenRouter chat completions endpoint"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, jitter=0.0, error_rate=0.0,
+                 reply="Keep going! Small, consistent study sessions add up."):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reply = reply
+        self.server = ThreadingHTTPServer((host, port), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Chat completions URL to pass as the agent's api_url"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down and release its port"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenRouter stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before replying")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    args = parser.parse_args()
+
+    stub = OpenRouterStub(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"OpenRouter stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
@@ -1,15 +1,39 @@
 import requests
 import json
 from datetime import datetime, timedelta
-from database import StudyPlannerDB
-import sqlite3
+from database import StudyPlannerDB, ConcurrentUpdateError, to_day_ordinal
+import random
+import time
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+# Hours needed per subject scale with its difficulty
+DIFFICULTY_MULTIPLIER = {
+    "easy": 0.8,
+    "medium": 1.0,
+    "hard": 1.5
+}
+
+# Base assumption of 20 hours per subject
+BASE_SUBJECT_HOURS = 20
+
+# Rebalancing retries when another session edits the same plan concurrently
+MAX_REBALANCE_ATTEMPTS = 5
+REBALANCE_RETRY_DELAY = 0.05  # seconds, multiplied by the attempt number
 
 class AIStudyPlannerAgent:
-    def __init__(self, api_key="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"):
+    def __init__(self, api_key="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",
+                 db_path="study_planner.db", api_url="https://openrouter.ai/api/v1/chat/completions",
+                 request_timeout=30, db=None):
         self.api_key = api_key
-        self.db = StudyPlannerDB()
+        self.db = db if db is not None else StudyPlannerDB(db_path)
         self.model = "qwen/qwen3-coder:free"
+        self.api_url = api_url
+        self.request_timeout = request_timeout
     
+    @timed("agent.calculate_study_schedule")
     def calculate_study_schedule(self, subjects, exam_date_str, daily_hours, subject_difficulties=None):
         """
         Generate a personalized study schedule based on subjects, exam date, and daily hours
@@ -27,20 +51,12 @@ class AIStudyPlannerAgent:
             subject_difficulties = {subject: "medium" for subject in subjects}
         
         # Calculate total hours needed per subject based on difficulty
-        difficulty_multiplier = {
-            "easy": 0.8,
-            "medium": 1.0,
-            "hard": 1.5
-        }
-        
-        # Calculate total hours needed per subject
         subject_hours = {}
         for subject in subjects:
             difficulty = subject_difficulties.get(subject, "medium")
-            multiplier = difficulty_multiplier.get(difficulty, 1.0)
+            multiplier = DIFFICULTY_MULTIPLIER.get(difficulty, 1.0)
             # Base hours assumption - can be adjusted based on subject complexity
-            base_hours = 20  # Base assumption of 20 hours per subject
-            subject_hours[subject] = base_hours * multiplier
+            subject_hours[subject] = BASE_SUBJECT_HOURS * multiplier
         
         # Total hours needed
         total_hours_needed = sum(subject_hours.values())
@@ -76,6 +92,103 @@ class AIStudyPlannerAgent:
             "schedule": schedule
         }
     
+    @timed("agent.simulate_scenarios")
+    def simulate_scenarios(self, subjects, daily_hours_options, exam_dates, difficulties=("medium",)):
+        """
+        Evaluate every (daily_hours, exam_date, difficulty) combination in one
+        vectorized pass, using the same rules as calculate_study_schedule.
+        Nothing is written to the database.
+        
+        Each entry of difficulties is either a level applied to every subject
+        or a dict mapping subject to level. Returns a DataFrame with one row per
+        scenario: feasibility, the scaling factor applied to the subject hours,
+        and the hours each subject would get in an "hours[<subject>]" column,
+        so subject names cannot collide with the scenario columns.
+        """
+        if not len(subjects):
+            raise ValueError("simulate_scenarios needs at least one subject")
+        
+        today = datetime.now().date().toordinal()
+        hours = np.asarray(daily_hours_options, dtype=float)
+        exam_days = np.array([to_day_ordinal(exam_date) for exam_date in exam_dates])
+        available_days = np.maximum(exam_days - today, 1)  # At least one day for planning
+        
+        # Required hours per (difficulty, subject)
+        labels = []
+        multipliers = []
+        for difficulty in difficulties:
+            if isinstance(difficulty, dict):
+                levels = [difficulty.get(subject, "medium") for subject in subjects]
+                labels.append(", ".join(levels))
+            else:
+                levels = [difficulty] * len(subjects)
+                labels.append(difficulty)
+            multipliers.append([DIFFICULTY_MULTIPLIER.get(level, 1.0) for level in levels])
+        required = BASE_SUBJECT_HOURS * np.array(multipliers, dtype=float).reshape(len(labels), len(subjects))
+        total_needed = required.sum(axis=1)
+        
+        # Broadcast to (hours, exam date, difficulty)
+        total_available = (hours[:, None] * available_days[None, :])[:, :, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaling = np.where(total_available < total_needed, total_available / total_needed, 1.0)
+        feasible = np.broadcast_to(total_available >= total_needed, scaling.shape)
+        subject_hours = scaling[..., None] * required  # (hours, exam date, difficulty, subject)
+        
+        # Flatten to one row per scenario; labels are formatted once per axis value
+        shape = scaling.shape
+        exam_date_strs = np.array([datetime.fromordinal(int(day)).strftime("%Y-%m-%d") for day in exam_days], dtype=object)
+        h_idx, d_idx, p_idx = np.indices(shape).reshape(3, -1)
+        result = pd.DataFrame({
+            "daily_hours": hours[h_idx],
+            "exam_date": exam_date_strs[d_idx],
+            "difficulty": np.array(labels, dtype=object)[p_idx],
+            "available_days": available_days[d_idx],
+            "total_hours_needed": total_needed[p_idx],
+            "total_available_hours": np.broadcast_to(total_available, shape).ravel(),
+            "feasible": feasible.ravel(),
+            "scaling_factor": scaling.ravel(),
+        })
+        flat_subject_hours = subject_hours.reshape(-1, len(subjects))
+        for i, subject in enumerate(subjects):
+            result[f"hours[{subject}]"] = flat_subject_hours[:, i]
+        return result
+    
+    @timed("agent.create_study_plan")
+    def create_study_plan(self, user_id, subjects, exam_date_str, daily_hours, subject_difficulties):
+        """
+        Generate a study schedule and save one plan per subject with its daily entries
+        """
+        plan_data = self.calculate_study_schedule(
+            subjects=subjects,
+            exam_date_str=exam_date_str,
+            daily_hours=daily_hours,
+            subject_difficulties=subject_difficulties
+        )
+        
+        plan_ids = []
+        for subject in subjects:
+            plan_id = self.db.create_study_plan(
+                user_id=user_id,
+                subject=subject,
+                exam_date=exam_date_str,
+                daily_hours=daily_hours,
+                difficulty=subject_difficulties[subject],
+                total_hours=plan_data['subject_hours'][subject]
+            )
+            plan_ids.append(plan_id)
+            
+            # Create daily schedule entries
+            for sched_item in plan_data['schedule']:
+                if sched_item['subject'] == subject:
+                    self.db.create_daily_schedule(
+                        plan_id=plan_id,
+                        study_date=sched_item['date'],
+                        subject=sched_item['subject'],
+                        planned_hours=sched_item['hours']
+                    )
+        
+        return plan_ids
+    
     def _generate_daily_schedule(self, subjects, subject_hours, available_days, daily_hours, start_date, exam_date):
         """
         Generate a daily schedule by distributing subject hours across available days
@@ -128,9 +241,12 @@ class AIStudyPlannerAgent:
         
         return schedule
     
+    @timed("agent.adjust_schedule_after_missed_day")
     def adjust_schedule_after_missed_day(self, plan_id, missed_date):
         """
-        Adjust the remaining schedule when a day is marked as missed
+        Adjust the remaining schedule when a day is marked as missed.
+        Updates are compare-and-swap on row versions; if another session edits
+        the plan concurrently the rebalance is re-read and retried.
         """
         # Get the original plan details
         plan_details = self.db.get_study_plan(plan_id)
@@ -140,44 +256,49 @@ class AIStudyPlannerAgent:
         # Extract plan information
         _, user_id, subject, exam_date, daily_hours, difficulty, total_hours, completed_hours, status, _ = plan_details
         
-        # Get all remaining schedule items after the missed date
-        all_schedule = self.db.get_daily_schedule(plan_id)
-        
-        # Find the missed day and mark it
-        missed_schedule_id = None
-        for schedule_item in all_schedule:
-            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at = schedule_item
-            if str(study_date) == str(missed_date) and not missed:
-                self.db.mark_day_missed(id)
-                missed_schedule_id = id
-                break
-        
-        if not missed_schedule_id:
-            return None  # Day was not found or already marked as missed
-        
-        # Get all remaining days after the missed date
-        remaining_schedule = []
-        for item in all_schedule:
-            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at = item
-            if datetime.strptime(str(study_date), "%Y-%m-%d").date() > datetime.strptime(str(missed_date), "%Y-%m-%d").date():
-                remaining_schedule.append(item)
+        missed_day = to_day_ordinal(missed_date)
+        for attempt in range(MAX_REBALANCE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, REBALANCE_RETRY_DELAY * attempt))
+            
+            # Read the plan version before the rows so any later change is detected
+            plan_version = self.db.get_plan_version(plan_id)
+            
+            # Find the missed day, unless it is already completed or marked as missed
+            schedule = self.db.get_daily_schedule_range(plan_id, missed_day, missed_day, with_version=True)
+            missed_item = next((item for item in schedule if not item[6] and not item[7]), None)
+            if missed_item is None:
+                return None  # Day was not found, already completed or already marked as missed
+            
+            # Get all remaining days after the missed date
+            remaining_schedule = self.db.get_daily_schedule_range(plan_id, start_date=missed_day + 1, with_version=True)
+            
+            # Mark the day missed and rebalance in one transaction, so a
+            # conflict leaves the day unmarked and the whole step can be retried
+            try:
+                return self._rebalance_remaining_schedule(plan_id, plan_version, remaining_schedule, daily_hours,
+                                                          missed_entry=(missed_item[0], missed_item[10]))
+            except ConcurrentUpdateError:
+                continue
         
-        # Rebalance the remaining schedule
-        return self._rebalance_remaining_schedule(plan_id, remaining_schedule, daily_hours)
+        raise ConcurrentUpdateError(f"Could not rebalance plan {plan_id} after {MAX_REBALANCE_ATTEMPTS} attempts")
     
-    def _rebalance_remaining_schedule(self, plan_id, remaining_schedule, daily_hours):
+    @timed("agent.rebalance_remaining_schedule")
+    def _rebalance_remaining_schedule(self, plan_id, plan_version, remaining_schedule, daily_hours, missed_entry=None):
         """
-        Rebalance the remaining schedule after a missed day
+        Rebalance the remaining schedule after a missed day.
+        missed_entry is the (id, version) of the missed day, marked in the same transaction.
         """
         # Calculate total remaining hours to be redistributed
         total_remaining_hours = 0
         for item in remaining_schedule:
-            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at = item
+            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at, version = item
             total_remaining_hours += planned_hours
         
         # Get the remaining days
         remaining_days = len(remaining_schedule)
         if remaining_days == 0:
+            self.db.update_planned_hours(plan_id, plan_version, [], missed_entry)
             return None
         
         # Calculate new daily allocation
@@ -185,8 +306,9 @@ class AIStudyPlannerAgent:
         
         # Update the schedule with new allocations
         updated_schedule = []
+        updates = []
         for item in remaining_schedule:
-            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at = item
+            id, plan_id_db, study_date, subject, planned_hours, actual_hours, completed, missed, notes, created_at, version = item
             
             # Distribute based on subject priority/difficulty
             updated_item = {
@@ -197,20 +319,14 @@ class AIStudyPlannerAgent:
                 "new_hours": round(new_daily_hours, 2)
             }
             updated_schedule.append(updated_item)
-            
-            # Update the database with new hours
-            conn = sqlite3.connect(self.db.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE daily_schedule 
-                SET planned_hours = ?
-                WHERE id = ?
-            ''', (round(new_daily_hours, 2), id))
-            conn.commit()
-            conn.close()
+            updates.append((id, version, round(new_daily_hours, 2)))
+        
+        # Write all new hours in one short transaction; raises ConcurrentUpdateError on conflict
+        self.db.update_planned_hours(plan_id, plan_version, updates, missed_entry)
         
         return updated_schedule
     
+    @timed("llm.generate_motivational_tip")
     def generate_motivational_tip(self, subject, progress_percentage):
         """
         Generate a motivational tip using AI based on subject and progress
@@ -223,7 +339,7 @@ class AIStudyPlannerAgent:
         
         try:
             response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
+                url=self.api_url,
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json",
@@ -238,7 +354,8 @@ class AIStudyPlannerAgent:
                             "content": prompt
                         }
                     ]
-                })
+                }),
+                timeout=self.request_timeout
             )
             
             if response.status_code == 200:
@@ -251,6 +368,7 @@ class AIStudyPlannerAgent:
             print(f"Error generating motivational tip: {e}")
             return "Stay focused and keep moving forward. Every small step counts towards your success!"
     
+    @timed("llm.generate_study_advice")
     def generate_study_advice(self, subject, difficulty, remaining_days, hours_left):
         """
         Generate personalized study advice for a specific subject
@@ -263,7 +381,7 @@ class AIStudyPlannerAgent:
         
         try:
             response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
+                url=self.api_url,
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json",
@@ -278,7 +396,8 @@ class AIStudyPlannerAgent:
                             "content": prompt
                         }
                     ]
-                })
+                }),
+                timeout=self.request_timeout
             )
             
             if response.status_code == 200: